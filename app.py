@@ -1,9 +1,21 @@
 import streamlit as st
 from openai import OpenAI
+import httpx
 import sqlite3
 import datetime
 import os
 import json
+import threading
+import contextlib
+import hashlib
+import concurrent.futures
+import queue
+import itertools
+import collections
+import time
+import atexit
+import logging
+import shutil
 
 # Try to load from .env file if available
 try:
@@ -12,7 +24,31 @@ try:
 except ImportError:
     pass  # dotenv not installed, that's fine
 
+# Rate-limit (429), timeout and 5xx responses are retried by the SDK with
+# exponential backoff and jitter, honoring Retry-After
+OPENAI_MAX_RETRIES = 4
+
+# Models per task, overridable per deployment. Chapters start on the cheaper,
+# faster model and escalate to the flagship once recent ratings drop below 3.
+# Polishing is a copyedit, so it uses the cheap model unless the sidebar says otherwise
+CHAPTER_MODEL = os.environ.get("CHAPTER_MODEL", "gpt-4o-mini")
+CHAPTER_ESCALATION_MODEL = os.environ.get("CHAPTER_ESCALATION_MODEL", "gpt-4o")
+POLISH_MODEL = os.environ.get("POLISH_MODEL", "gpt-4o-mini")
+RATING_MODEL = os.environ.get("RATING_MODEL", "gpt-4o-mini")
+POLISH_MODEL_CHOICES = {"Fast (gpt-4o-mini)": "gpt-4o-mini", "Best (gpt-4o)": "gpt-4o"}
+if POLISH_MODEL not in POLISH_MODEL_CHOICES.values():
+    POLISH_MODEL_CHOICES = {f"Configured ({POLISH_MODEL})": POLISH_MODEL, **POLISH_MODEL_CHOICES}
+
 # Secure OpenAI client initialization
+@st.cache_resource(show_spinner=False)
+def create_openai_client(api_key):
+    """Build one OpenAI client per key so its HTTP connection pool survives reruns"""
+    # Shared by every session thread, so size the keep-alive pool for concurrent users;
+    # HTTP/2 lets concurrent calls (rating + continuation) share one TLS connection
+    http_client = httpx.Client(http2=True,
+                               limits=httpx.Limits(max_connections=100, max_keepalive_connections=20))
+    return OpenAI(api_key=api_key, http_client=http_client, max_retries=OPENAI_MAX_RETRIES)
+
 def get_openai_client():
     """Initialize OpenAI client with secure key management"""
     try:
@@ -27,7 +63,7 @@ def get_openai_client():
             api_key = os.environ["OPENAI_API_KEY"]
         
         if api_key and api_key.startswith("sk-"):
-            return OpenAI(api_key=api_key)
+            return create_openai_client(api_key)
         else:
             st.error("❌ OpenAI API key not found. Please configure your API key.")
             st.info("💡 See the setup instructions in the sidebar.")
@@ -37,21 +73,248 @@ def get_openai_client():
         st.error(f"❌ Error connecting to OpenAI: {str(e)}")
         return None
 
-# Initialize database with enhanced schema
+# Shared database connection. Deployments can put the database on tmpfs
+# (STORY_DB_PATH=/dev/shm/writing_sessions.db) and set STORY_DB_SNAPSHOT_PATH
+# to a persistent file that is refreshed periodically and restored on startup
+DB_PATH = os.environ.get("STORY_DB_PATH", "writing_sessions.db")
+DB_SNAPSHOT_PATH = os.environ.get("STORY_DB_SNAPSHOT_PATH")
+DB_SNAPSHOT_INTERVAL = 60  # seconds
+
+# SQL statements, kept as constants so sqlite3's per-connection statement cache always hits
+# Timestamps are epoch milliseconds computed by SQLite itself. New tables also
+# use this as the column DEFAULT, but tables created by older versions have no
+# default (SQLite can't add one in place), so inserts still pass it explicitly
+SQL_NOW_MS = "CAST(ROUND((julianday('now') - 2440587.5) * 86400000) AS INTEGER)"
+SQL_INSERT_STORY = f"INSERT INTO stories (title, user_text, created_at, last_updated) VALUES (?, ?, {SQL_NOW_MS}, {SQL_NOW_MS})"
+SQL_DELETE_STORY_CHAPTERS = "DELETE FROM chapters WHERE story_id = ?"
+SQL_DELETE_STORY_POLISH_SESSIONS = "DELETE FROM polish_sessions WHERE story_id = ?"
+SQL_DELETE_STORY = "DELETE FROM stories WHERE id = ?"
+SQL_LIST_STORIES = "SELECT id, title, created_at FROM stories ORDER BY last_updated DESC"
+SQL_GET_STORY = "SELECT title, user_text FROM stories WHERE id = ?"
+# Latest AI feedback on the user's writing in a chapter row, which is stored
+# against the displayed chapter number (2 * chapter_number - 1: 1, 3, 5...)
+SQL_CHAPTER_FEEDBACK = ("(SELECT p.feedback FROM polish_sessions p WHERE p.story_id = c.story_id "
+                        "AND p.original_text = 'Chapter ' || (2 * c.chapter_number - 1) AND p.feedback IS NOT NULL "
+                        "ORDER BY p.created_at DESC, p.id DESC LIMIT 1) AS feedback")
+SQL_GET_CHAPTERS = f"SELECT c.chapter_number, c.user_content, c.ai_content, c.ai_style, c.user_rating, c.ai_rating, c.ai_level, {SQL_CHAPTER_FEEDBACK} FROM chapters c WHERE c.story_id = ? ORDER BY c.chapter_number"
+SQL_GET_CHAPTERS_LEGACY = f"SELECT c.chapter_number, c.user_content, c.ai_content, c.ai_style, c.user_rating, c.ai_rating, {SQL_CHAPTER_FEEDBACK} FROM chapters c WHERE c.story_id = ? ORDER BY c.chapter_number"
+SQL_GET_STORY_SUMMARIES = """WITH agg AS (
+    SELECT story_id, COUNT(*) AS chapter_count,
+           AVG(NULLIF(ai_rating, 0)) AS avg_ai_rating, AVG(NULLIF(user_rating, 0)) AS avg_user_rating,
+           MIN(chapter_number) AS first_number, MAX(chapter_number) AS latest_number
+    FROM chapters GROUP BY story_id)
+SELECT agg.story_id, agg.chapter_count, agg.avg_ai_rating, agg.avg_user_rating,
+       f.ai_style AS first_ai_style, f.ai_level AS first_ai_level, f.ai_rating AS first_ai_rating, f.user_rating AS first_user_rating,
+       l.ai_style AS latest_ai_style, l.ai_level AS latest_ai_level, l.ai_rating AS latest_ai_rating, l.user_rating AS latest_user_rating
+FROM agg
+JOIN chapters f ON f.story_id = agg.story_id AND f.chapter_number = agg.first_number
+JOIN chapters l ON l.story_id = agg.story_id AND l.chapter_number = agg.latest_number"""
+SQL_GET_RECENT_CHAPTERS = "SELECT chapter_number, user_content, ai_content FROM chapters WHERE story_id = ? ORDER BY chapter_number DESC LIMIT ?"
+SQL_INSERT_CHAPTER = f"INSERT INTO chapters (story_id, chapter_number, user_content, ai_content, ai_style, ai_level, ai_rating, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, {SQL_NOW_MS})"
+SQL_TOUCH_STORY = f"UPDATE stories SET last_updated = {SQL_NOW_MS} WHERE id = ?"
+# Ratings are set once; the IS NULL guard makes the first of two concurrent submits win
+SQL_UPDATE_CHAPTER_RATING = "UPDATE chapters SET user_rating = ? WHERE story_id = ? AND chapter_number = ? AND user_rating IS NULL"
+SQL_INSERT_POLISH_SESSION = f"INSERT INTO polish_sessions (story_id, original_text, polished_text, ai_rating, created_at) VALUES (?, ?, ?, ?, {SQL_NOW_MS})"
+SQL_UPDATE_POLISH_RATING = "UPDATE polish_sessions SET user_rating = ?, feedback = ? WHERE id = ? AND user_rating IS NULL"
+SQL_GET_POLISH_SESSION = "SELECT original_text, polished_text, ai_rating FROM polish_sessions WHERE id = ?"
+SQL_GET_RATING_HISTORY = "SELECT user_rating, feedback FROM polish_sessions WHERE story_id = ? AND user_rating IS NOT NULL ORDER BY created_at DESC, id DESC LIMIT 5"
+SQL_GET_SAVED_RATING = "SELECT rating, feedback FROM rating_cache WHERE key = ?"
+SQL_SAVE_RATING = "INSERT OR REPLACE INTO rating_cache (key, rating, feedback) VALUES (?, ?, ?)"
+SQL_INSERT_AI_FEEDBACK = f"INSERT INTO polish_sessions (story_id, original_text, polished_text, ai_rating, feedback, created_at) VALUES (?, ?, ?, ?, ?, {SQL_NOW_MS})"
+
+@st.cache_resource
+def get_conn():
+    """Open one SQLite connection shared by every helper across reruns"""
+    # A tmpfs database is gone after a reboot; start from the last snapshot
+    if DB_SNAPSHOT_PATH and not os.path.exists(DB_PATH) and os.path.exists(DB_SNAPSHOT_PATH):
+        shutil.copyfile(DB_SNAPSHOT_PATH, DB_PATH)
+    # Room for every SQL_* constant, so the statement cache never evicts a hot query
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, cached_statements=256)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-64000")  # ~64 MB page cache
+    conn.execute("PRAGMA mmap_size=268435456")  # read pages through a 256 MB memory map
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+@st.cache_resource
+def get_read_conn():
+    """Open a read-only connection for cached reads, so they only ever see committed data"""
+    # The writer's connection can be mid-transaction, so reads never share it.
+    # get_conn() first, so the file exists and is already in WAL mode
+    get_conn()
+    conn = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True, check_same_thread=False, cached_statements=256)
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-64000")
+    conn.execute("PRAGMA mmap_size=268435456")
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+def snapshot_db():
+    """Write a consistent copy of the database to DB_SNAPSHOT_PATH"""
+    # VACUUM INTO refuses to overwrite, so build a temp file and swap it in
+    tmp_path = DB_SNAPSHOT_PATH + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    # A separate read-only connection, so the snapshot never blocks the shared handle
+    conn = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True)
+    try:
+        conn.execute("VACUUM INTO ?", (tmp_path,))
+    finally:
+        conn.close()
+    os.replace(tmp_path, DB_SNAPSHOT_PATH)
+
+def run_db_snapshots(version):
+    """Snapshot the database every DB_SNAPSHOT_INTERVAL seconds if anything was written"""
+    snapshot_version = version['value']
+    while True:
+        time.sleep(DB_SNAPSHOT_INTERVAL)
+        current = version['value']
+        if current == snapshot_version:
+            continue
+        try:
+            snapshot_db()
+            snapshot_version = current
+        except Exception:
+            logging.getLogger(__name__).exception("Database snapshot failed")
+
+@st.cache_resource
+def start_db_snapshots():
+    """Start the snapshot thread once per process when STORY_DB_SNAPSHOT_PATH is set"""
+    if not DB_SNAPSHOT_PATH:
+        return None
+    thread = threading.Thread(target=run_db_snapshots, args=(get_db_version(),),
+                              name="db-snapshot", daemon=True)
+    thread.start()
+    # Registered before the write queue's join, so it runs after queued writes are flushed
+    atexit.register(snapshot_db)
+    return thread
+
+@st.cache_resource
+def get_write_lock():
+    """Serialize writes on the shared connection across session threads"""
+    return threading.Lock()
+
+@st.cache_resource
+def get_db_version():
+    """Process-wide write counter used to key cached reads"""
+    return {'value': 0}
+
+@contextlib.contextmanager
+def db_write():
+    """Run writes in one locked transaction and invalidate cached reads"""
+    # Apply this session's queued writes first so statements commit in call order
+    wait_for_writes()
+    conn = get_conn()
+    with get_write_lock():
+        with conn:
+            yield conn
+        get_db_version()['value'] += 1
+
+# Background writer: queued writes are committed off the rerun path, with
+# whatever queued up during a commit grouped into the next transaction
+WRITE_BATCH_MAX = 64
+
+def commit_writes(conn, lock, version, batch):
+    """Commit the statements of queued (future, statements, invalidates) items in one transaction"""
+    with lock:
+        with conn:
+            # Consecutive runs of the same statement are bound in one executemany call
+            statements = (statement for _, item, _ in batch for statement in item)
+            for sql, run in itertools.groupby(statements, key=lambda statement: statement[0]):
+                conn.executemany(sql, [params for _, params in run])
+        # Cache-only rows (saved AI ratings) aren't read through st.cache_data,
+        # so they leave every cached read valid
+        if any(invalidates for _, _, invalidates in batch):
+            version['value'] += 1
+
+def run_db_writer(write_queue, conn, lock, version):
+    """Drain queued writes and resolve each item's future once it has committed"""
+    while True:
+        # Never hold a lone write back; only group what is already waiting
+        batch = [write_queue.get()]
+        while len(batch) < WRITE_BATCH_MAX:
+            try:
+                batch.append(write_queue.get_nowait())
+            except queue.Empty:
+                break
+        
+        errors = [None] * len(batch)
+        try:
+            commit_writes(conn, lock, version, batch)
+        except Exception as e:
+            if len(batch) == 1:
+                errors[0] = e
+            else:
+                # The batch rolled back as a whole; retry each item on its own so
+                # a bad write only fails its own caller
+                for i, item in enumerate(batch):
+                    try:
+                        commit_writes(conn, lock, version, [item])
+                    except Exception as item_error:
+                        errors[i] = item_error
+        
+        for (future, _, _), error in zip(batch, errors):
+            if error is None:
+                future.set_result(None)
+            else:
+                logging.getLogger(__name__).error("Background DB write failed", exc_info=error)
+                future.set_exception(error)
+            write_queue.task_done()
+
+@st.cache_resource
+def get_write_queue():
+    """Start the background writer thread once per process"""
+    write_queue = queue.Queue()
+    threading.Thread(target=run_db_writer, 
+                     args=(write_queue, get_conn(), get_write_lock(), get_db_version()),
+                     name="db-writer", daemon=True).start()
+    # Don't drop queued writes when the server shuts down
+    atexit.register(write_queue.join)
+    return write_queue
+
+def queue_write(*statements):
+    """Queue (sql, params) statements to be committed together in the background"""
+    future = concurrent.futures.Future()
+    get_write_queue().put((future, statements, True))
+    # Tracked per session, so reads only wait on this user's own writes
+    st.session_state.setdefault('pending_writes', []).append(future)
+    return future
+
+def wait_for_writes():
+    """Block until this session's queued writes have committed, reporting any that failed"""
+    pending = st.session_state.get('pending_writes')
+    if not pending:
+        return
+    st.session_state.pending_writes = []
+    for future in pending:
+        try:
+            future.result()
+        except Exception as e:
+            st.error(f"❌ Error saving your changes: {str(e)}")
+
+def db_read():
+    """Get the read connection once this session's pending writes are visible"""
+    wait_for_writes()
+    return get_read_conn()
+
+# Initialize database with enhanced schema (runs once per process)
+@st.cache_resource(show_spinner=False)
 def init_db():
-    conn = sqlite3.connect('writing_sessions.db')
+    conn = get_conn()
     c = conn.cursor()
     
     # Stories table
-    c.execute('''CREATE TABLE IF NOT EXISTS stories
+    c.execute(f'''CREATE TABLE IF NOT EXISTS stories
                  (id INTEGER PRIMARY KEY AUTOINCREMENT,
                   title TEXT,
                   user_text TEXT,
-                  created_at TIMESTAMP,
-                  last_updated TIMESTAMP)''')
+                  created_at INTEGER DEFAULT ({SQL_NOW_MS}),
+                  last_updated INTEGER DEFAULT ({SQL_NOW_MS}))''')
     
     # Chapters table with ratings and style
-    c.execute('''CREATE TABLE IF NOT EXISTS chapters
+    c.execute(f'''CREATE TABLE IF NOT EXISTS chapters
                  (id INTEGER PRIMARY KEY AUTOINCREMENT,
                   story_id INTEGER,
                   chapter_number INTEGER,
@@ -61,7 +324,7 @@ def init_db():
                   ai_level TEXT,
                   user_rating INTEGER,
                   ai_rating INTEGER,
-                  created_at TIMESTAMP,
+                  created_at INTEGER DEFAULT ({SQL_NOW_MS}),
                   FOREIGN KEY(story_id) REFERENCES stories(id))''')
     
     # Check if ai_level column exists, if not add it
@@ -71,7 +334,7 @@ def init_db():
         c.execute("ALTER TABLE chapters ADD COLUMN ai_level TEXT DEFAULT 'middle_school'")
     
     # Polish sessions table
-    c.execute('''CREATE TABLE IF NOT EXISTS polish_sessions
+    c.execute(f'''CREATE TABLE IF NOT EXISTS polish_sessions
                  (id INTEGER PRIMARY KEY AUTOINCREMENT,
                   story_id INTEGER,
                   original_text TEXT,
@@ -79,263 +342,472 @@ def init_db():
                   ai_rating INTEGER,
                   user_rating INTEGER,
                   feedback TEXT,
-                  created_at TIMESTAMP,
+                  created_at INTEGER DEFAULT ({SQL_NOW_MS}),
                   FOREIGN KEY(story_id) REFERENCES stories(id))''')
     
+    # AI ratings keyed by a hash of model + text, so they survive restarts
+    c.execute(f'''CREATE TABLE IF NOT EXISTS rating_cache
+                 (key TEXT PRIMARY KEY,
+                  rating INTEGER,
+                  feedback TEXT,
+                  created_at INTEGER DEFAULT ({SQL_NOW_MS})) WITHOUT ROWID''')
+    
+    # Timestamps are stored as epoch milliseconds; convert rows written as
+    # local-time TEXT by older versions
+    for table, timestamp_columns in (("stories", ("created_at", "last_updated")),
+                                     ("chapters", ("created_at",)),
+                                     ("polish_sessions", ("created_at",))):
+        for column in timestamp_columns:
+            c.execute(f"UPDATE {table} SET {column} = CAST(ROUND((julianday({column}, 'utc') - 2440587.5) * 86400000) AS INTEGER) "
+                      f"WHERE typeof({column}) = 'text'")
+    
+    # Indexes for the per-story chapter scan and the story list ordering
+    c.execute("CREATE INDEX IF NOT EXISTS idx_chapters_story ON chapters(story_id, chapter_number)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_stories_last_updated ON stories(last_updated DESC)")
+    # Latest-feedback lookup; ascending created_at so a backward scan also yields
+    # the id DESC tie-break without a temp B-tree sort
+    c.execute("CREATE INDEX IF NOT EXISTS idx_polish_feedback ON polish_sessions(story_id, original_text, created_at)")
+    # Rating history for prompts, newest first (same backward-scan reasoning)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_polish_history ON polish_sessions(story_id, created_at)")
+    
     conn.commit()
-    conn.close()
+    start_db_snapshots()
 
 # Database helper functions
 def create_story(title, user_text):
-    conn = sqlite3.connect('writing_sessions.db')
-    c = conn.cursor()
-    c.execute("INSERT INTO stories (title, user_text, created_at, last_updated) VALUES (?, ?, ?, ?)",
-              (title, user_text, datetime.datetime.now(), datetime.datetime.now()))
-    story_id = c.lastrowid
-    conn.commit()
-    conn.close()
-    return story_id
+    with db_write() as conn:
+        c = conn.execute(SQL_INSERT_STORY, (title, user_text))
+    return c.lastrowid
 
 def delete_story(story_id):
-    conn = sqlite3.connect('writing_sessions.db')
-    c = conn.cursor()
-    # Delete chapters first
-    c.execute("DELETE FROM chapters WHERE story_id = ?", (story_id,))
-    # Delete polish sessions
-    c.execute("DELETE FROM polish_sessions WHERE story_id = ?", (story_id,))
-    # Delete story
-    c.execute("DELETE FROM stories WHERE id = ?", (story_id,))
-    conn.commit()
-    conn.close()
+    """Delete a story with its chapters and polish sessions in one transaction"""
+    with db_write() as conn:
+        # Delete chapters first
+        conn.execute(SQL_DELETE_STORY_CHAPTERS, (story_id,))
+        # Delete polish sessions
+        conn.execute(SQL_DELETE_STORY_POLISH_SESSIONS, (story_id,))
+        # Delete story
+        conn.execute(SQL_DELETE_STORY, (story_id,))
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _get_stories_cached(version):
+    c = get_read_conn().execute(SQL_LIST_STORIES)
+    return c.fetchall()
 
 def get_stories():
-    conn = sqlite3.connect('writing_sessions.db')
-    c = conn.cursor()
-    c.execute("SELECT id, title, created_at FROM stories ORDER BY last_updated DESC")
-    stories = c.fetchall()
-    conn.close()
-    return stories
+    wait_for_writes()
+    return _get_stories_cached(get_db_version()['value'])
+
+@st.cache_data(show_spinner=False, max_entries=128)
+def _get_story_details_cached(story_id, version):
+    c = get_read_conn().execute(SQL_GET_STORY, (story_id,))
+    return c.fetchone()
 
 def get_story_details(story_id):
-    conn = sqlite3.connect('writing_sessions.db')
-    c = conn.cursor()
-    c.execute("SELECT title, user_text FROM stories WHERE id = ?", (story_id,))
-    result = c.fetchone()
-    conn.close()
-    return result
+    wait_for_writes()
+    return _get_story_details_cached(story_id, get_db_version()['value'])
 
-def get_chapters(story_id):
-    conn = sqlite3.connect('writing_sessions.db')
-    c = conn.cursor()
+@st.cache_data(show_spinner=False, max_entries=128)
+def _get_chapters_cached(story_id, version):
+    # Chapters are returned as dicts keyed by column name; sqlite3.Row itself
+    # can't be pickled into the st.cache_data store
+    c = get_read_conn().cursor()
+    c.row_factory = sqlite3.Row
     # Try to get with ai_level first
     try:
-        c.execute("SELECT chapter_number, user_content, ai_content, ai_style, user_rating, ai_rating, ai_level FROM chapters WHERE story_id = ? ORDER BY chapter_number", (story_id,))
-        chapters = c.fetchall()
+        chapters = [dict(ch) for ch in c.execute(SQL_GET_CHAPTERS, (story_id,))]
     except:
         # If ai_level doesn't exist, get without it and add default
-        c.execute("SELECT chapter_number, user_content, ai_content, ai_style, user_rating, ai_rating FROM chapters WHERE story_id = ? ORDER BY chapter_number", (story_id,))
-        chapters = [(ch[0], ch[1], ch[2], ch[3], ch[4], ch[5], 'middle_school') for ch in c.fetchall()]
-    conn.close()
+        chapters = [dict(ch, ai_level='middle_school') for ch in c.execute(SQL_GET_CHAPTERS_LEGACY, (story_id,))]
     return chapters
 
-def add_chapter(story_id, chapter_number, user_content, ai_content, ai_style, ai_level, ai_rating):
-    conn = sqlite3.connect('writing_sessions.db')
-    c = conn.cursor()
-    c.execute("INSERT INTO chapters (story_id, chapter_number, user_content, ai_content, ai_style, ai_level, ai_rating, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-              (story_id, chapter_number, user_content, ai_content, ai_style, ai_level, ai_rating, datetime.datetime.now()))
-    conn.commit()
-    conn.close()
+def get_chapters(story_id):
+    wait_for_writes()
+    return _get_chapters_cached(story_id, get_db_version()['value'])
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _get_story_summaries_cached(version):
+    c = get_read_conn().cursor()
+    c.row_factory = sqlite3.Row
+    summaries = {}
+    for row in c.execute(SQL_GET_STORY_SUMMARIES):
+        summaries[row["story_id"]] = {
+            'chapter_count': row["chapter_count"],
+            'avg_ai_rating': row["avg_ai_rating"],
+            'avg_user_rating': row["avg_user_rating"],
+            'first': {key: row[f"first_{key}"] for key in ("ai_style", "ai_level", "ai_rating", "user_rating")},
+            'latest': {key: row[f"latest_{key}"] for key in ("ai_style", "ai_level", "ai_rating", "user_rating")},
+        }
+    return summaries
+
+def get_story_summaries():
+    """Get chapter count, average ratings and first/latest chapter of every story with chapters, keyed by story id"""
+    wait_for_writes()
+    return _get_story_summaries_cached(get_db_version()['value'])
+
+def get_recent_chapters(story_id, limit=5):
+    """Get the last few chapters of a story for AI context, oldest first"""
+    c = db_read().execute(SQL_GET_RECENT_CHAPTERS,
+                           (story_id, limit))
+    return c.fetchall()[::-1]
+
+def add_chapter(story_id, chapter_number, user_content, ai_content, ai_style, ai_level, ai_rating, feedback):
+    """Save a chapter with the AI feedback on the user's writing in it"""
+    # Feedback is stored in polish_sessions under the displayed number of the
+    # user's chapter (2 * chapter_number - 1), as SQL_CHAPTER_FEEDBACK expects.
+    # Saved synchronously in one transaction: the chapter holds a paid generation,
+    # so a failure has to reach the caller rather than a background log
+    with db_write() as conn:
+        conn.execute(SQL_INSERT_CHAPTER, (story_id, chapter_number, user_content, ai_content, ai_style, ai_level, ai_rating))
+        conn.execute(SQL_INSERT_AI_FEEDBACK, (story_id, f"Chapter {2 * chapter_number - 1}", "", 0, feedback))
+        conn.execute(SQL_TOUCH_STORY, (story_id,))
 
 def update_chapter_rating(story_id, chapter_number, user_rating):
-    conn = sqlite3.connect('writing_sessions.db')
-    c = conn.cursor()
-    c.execute("UPDATE chapters SET user_rating = ? WHERE story_id = ? AND chapter_number = ?",
-              (user_rating, story_id, chapter_number))
-    conn.commit()
-    conn.close()
+    return queue_write((SQL_UPDATE_CHAPTER_RATING, (user_rating, story_id, chapter_number)))
 
 def add_polish_session(story_id, original_text, polished_text, ai_rating):
-    conn = sqlite3.connect('writing_sessions.db')
-    c = conn.cursor()
-    c.execute("INSERT INTO polish_sessions (story_id, original_text, polished_text, ai_rating, created_at) VALUES (?, ?, ?, ?, ?)",
-              (story_id, original_text, polished_text, ai_rating, datetime.datetime.now()))
-    session_id = c.lastrowid
-    conn.commit()
-    conn.close()
-    return session_id
+    with db_write() as conn:
+        c = conn.execute(SQL_INSERT_POLISH_SESSION,
+                         (story_id, original_text, polished_text, ai_rating))
+    return c.lastrowid
 
 def update_polish_rating(session_id, user_rating, feedback):
-    conn = sqlite3.connect('writing_sessions.db')
-    c = conn.cursor()
-    c.execute("UPDATE polish_sessions SET user_rating = ?, feedback = ? WHERE id = ?",
-              (user_rating, feedback, session_id))
-    conn.commit()
-    conn.close()
+    return queue_write((SQL_UPDATE_POLISH_RATING, (user_rating, feedback, session_id)))
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _get_polish_session_cached(session_id, version):
+    c = get_read_conn().execute(SQL_GET_POLISH_SESSION, (session_id,))
+    return c.fetchone()
+
+def get_polish_session(session_id):
+    """Get the original text, polished text and AI rating of a polish session"""
+    wait_for_writes()
+    return _get_polish_session_cached(session_id, get_db_version()['value'])
+
+@st.cache_data(show_spinner=False, max_entries=128)
+def _get_user_rating_history_cached(story_id, version):
+    c = get_read_conn().execute(SQL_GET_RATING_HISTORY, (story_id,))
+    return c.fetchall()
 
 def get_user_rating_history(story_id):
     """Get user's rating history to help AI improve"""
-    conn = sqlite3.connect('writing_sessions.db')
-    c = conn.cursor()
-    c.execute("SELECT user_rating, feedback FROM polish_sessions WHERE story_id = ? AND user_rating IS NOT NULL ORDER BY created_at DESC LIMIT 5", (story_id,))
-    ratings = c.fetchall()
-    conn.close()
-    return ratings
-
-def store_ai_feedback(story_id, chapter_num, feedback):
-    """Store AI feedback for a chapter"""
-    conn = sqlite3.connect('writing_sessions.db')
-    c = conn.cursor()
-    # Store feedback in polish_sessions table temporarily
-    c.execute("INSERT INTO polish_sessions (story_id, original_text, polished_text, ai_rating, feedback, created_at) VALUES (?, ?, ?, ?, ?, ?)",
-              (story_id, f"Chapter {chapter_num}", "", 0, feedback, datetime.datetime.now()))
-    conn.commit()
-    conn.close()
-
-def get_ai_feedback(story_id, chapter_num):
-    """Get AI feedback for a chapter"""
-    conn = sqlite3.connect('writing_sessions.db')
-    c = conn.cursor()
-    c.execute("SELECT feedback FROM polish_sessions WHERE story_id = ? AND original_text = ? ORDER BY created_at DESC LIMIT 1", 
-              (story_id, f"Chapter {chapter_num}"))
-    result = c.fetchone()
-    conn.close()
-    return result[0] if result else None
+    wait_for_writes()
+    return _get_user_rating_history_cached(story_id, get_db_version()['value'])
 
 # AI Generation Functions
+@st.cache_resource
+def get_ai_executor():
+    """Thread pool for AI calls that run alongside the main script thread.
+    Only calls that make no st.* calls may run here, since Streamlit elements
+    can't be rendered from worker threads."""
+    return concurrent.futures.ThreadPoolExecutor(max_workers=8, thread_name_prefix="ai-call")
+
+@st.cache_resource
+def get_inflight_requests():
+    """Registry of in-flight AI requests shared by all sessions"""
+    return {}, threading.Lock()
+
+class RequestInterrupted(Exception):
+    """The leader of a coalesced request stopped before finishing (e.g. a rerun mid-stream)"""
+
+# Longest a caller waits on another session's identical request before making its own
+COALESCE_WAIT_TIMEOUT = 120  # seconds
+
+def coalesce_request(key, fn):
+    """Run fn once for concurrent callers sharing the same key"""
+    inflight, lock = get_inflight_requests()
+    with lock:
+        future = inflight.get(key)
+        is_leader = future is None
+        if is_leader:
+            future = concurrent.futures.Future()
+            inflight[key] = future
+    
+    if not is_leader:
+        try:
+            return future.result(timeout=COALESCE_WAIT_TIMEOUT)
+        except (concurrent.futures.TimeoutError, RequestInterrupted):
+            # The shared request stalled or was cut short; make our own
+            return fn()
+    
+    try:
+        result = fn()
+        future.set_result(result)
+        return result
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        # Streamlit's rerun/stop exceptions are BaseExceptions and skip the handler
+        # above; followers must still be released
+        if not future.done():
+            future.set_exception(RequestInterrupted())
+        with lock:
+            inflight.pop(key, None)
+
+def split_complete_blocks(text):
+    """Split markdown into finished blocks and the trailing block still being written"""
+    # Blocks end at a blank line, except inside a ``` fence
+    lines = text.split("\n")
+    blocks, current, in_fence = [], [], False
+    for line in lines[:-1]:
+        if line.lstrip().startswith("```"):
+            in_fence = not in_fence
+        if line.strip() or in_fence:
+            current.append(line)
+        elif current:
+            blocks.append("\n".join(current))
+            current = []
+    current.append(lines[-1])
+    return blocks, "\n".join(current)
+
+def render_stream(stream):
+    """Render a streamed chat completion as it arrives and return the full text"""
+    # Show tokens as they arrive so the reader isn't left staring at a spinner.
+    # Finished paragraphs are written once; only the paragraph in progress is
+    # re-rendered per delta, so each update costs O(tail) instead of O(text)
+    finished = st.container()
+    placeholder = st.empty()
+    parts = []
+    pending = ""
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            delta = chunk.choices[0].delta.content
+            parts.append(delta)
+            blocks, pending = split_complete_blocks(pending + delta)
+            for block in blocks:
+                finished.markdown(block)
+            placeholder.markdown(pending)
+    return "".join(parts).strip()
+
+# Prompt budget for the story so far, so prompt size stays flat as a story
+# grows; estimated at ~4 characters per token rather than tokenizing locally
+STORY_CONTEXT_TOKENS = 1000
+CHARS_PER_TOKEN = 4
+
+def build_story_context(opening, recent_chapters, max_tokens=STORY_CONTEXT_TOKENS):
+    """Assemble story context from the opening and the newest chapters that fit in max_tokens"""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    parts = []
+    total_len = len(opening) + 2
+    # Walk newest to oldest so the chapters closest to the continuation are kept;
+    # the newest chapter is always included, even past the budget
+    for ch_num, user_cont, ai_cont in reversed(recent_chapters):
+        total_len += len(user_cont or "") + len(ai_cont or "") + 16
+        if parts and total_len > max_chars:
+            break
+        parts.append(f"Chapter {ch_num}: {user_cont}\n{ai_cont}\n\n")
+    parts.append(opening + "\n\n")
+    return "".join(reversed(parts))
+
+# Writing level instructions for chapter generation
+LEVEL_INSTRUCTIONS = {
+    "professional": "Write with sophisticated vocabulary, complex sentence structures, rich descriptions, and nuanced character development. Use literary devices while keeping content age-appropriate.",
+    "college": "Write with clear, engaging prose using varied vocabulary and sentence structures. Include good descriptions and character development at a young adult level.",
+    "middle_school": "Write with simple, clear language that's easy to understand. Use shorter sentences, familiar words, and straightforward descriptions. Keep the story exciting and fun for younger readers."
+}
+
+# Kept byte-identical across calls so OpenAI can reuse the cached prompt prefix;
+# everything story- or user-specific goes in the user message
+CHAPTER_SYSTEM_PROMPT = """You are a creative writing assistant helping to continue a story.
+
+Rules:
+1. Continue the story naturally from where the user left off
+2. Match the tone and style of the existing story
+3. Apply the style direction given in the request
+4. Keep chapters engaging and well-paced
+5. End with a compelling hook for the next chapter
+6. Write between 200-400 words typically, but NEVER exceed 1,000 words
+7. Adjust complexity and vocabulary for the requested writing level
+8. For middle school level, aim for 200-300 words to keep it digestible"""
+
 def generate_next_chapter(client, story_context, user_chapter, style_direction, writing_level, previous_ratings):
     """Generate next chapter based on user's writing and style direction"""
     try:
         # Build context based on previous ratings
         rating_context = ""
-        if previous_ratings:
-            avg_rating = sum([r[0] for r in previous_ratings if r[0]]) / len([r for r in previous_ratings if r[0]])
+        model = CHAPTER_MODEL
+        ratings = [r[0] for r in previous_ratings if r[0]]
+        if ratings:
+            avg_rating = sum(ratings) / len(ratings)
             if avg_rating < 3:
                 rating_context = "The user has given lower ratings recently, so focus on being more engaging and creative. "
+                model = CHAPTER_ESCALATION_MODEL
             elif avg_rating >= 4:
                 rating_context = "The user has been happy with previous content, maintain this quality level. "
         
-        # Define writing level instructions
-        level_instructions = {
-            "professional": "Write with sophisticated vocabulary, complex sentence structures, rich descriptions, and nuanced character development. Use literary devices while keeping content age-appropriate.",
-            "college": "Write with clear, engaging prose using varied vocabulary and sentence structures. Include good descriptions and character development at a young adult level.",
-            "middle_school": "Write with simple, clear language that's easy to understand. Use shorter sentences, familiar words, and straightforward descriptions. Keep the story exciting and fun for younger readers."
-        }
-        
-        system_prompt = f"""You are a creative writing assistant helping to continue a story. 
-        {rating_context}
-        
-        Writing Level: {writing_level}
-        {level_instructions.get(writing_level, level_instructions['middle_school'])}
-        
-        Style direction: {style_direction}
-        
-        Rules:
-        1. Continue the story naturally from where the user left off
-        2. Match the tone and style of the existing story
-        3. Apply the style direction: {style_direction}
-        4. Keep chapters engaging and well-paced
-        5. End with a compelling hook for the next chapter
-        6. Write between 200-400 words typically, but NEVER exceed 1,000 words
-        7. Adjust complexity and vocabulary for the {writing_level} level
-        8. For middle school level, aim for 200-300 words to keep it digestible
-        """
-        
-        user_prompt = f"""Story context: {story_context}
+        user_prompt = f"""Writing Level: {writing_level}
+{LEVEL_INSTRUCTIONS.get(writing_level, LEVEL_INSTRUCTIONS['middle_school'])}
+
+Style direction: {style_direction}
+{rating_context}
+Story context: {story_context}
 
 User's latest chapter: {user_chapter}
 
 Continue this story with the style: {style_direction} at a {writing_level} writing level."""
 
-        with st.spinner(f"🎭 Creating a {style_direction} continuation at {writing_level} level..."):
-            response = client.chat.completions.create(
-                model="gpt-4o",
+        def request_chapter():
+            stream = client.chat.completions.create(
+                model=model,
                 messages=[
-                    {"role": "system", "content": system_prompt},
+                    {"role": "system", "content": CHAPTER_SYSTEM_PROMPT},
                     {"role": "user", "content": user_prompt}
                 ],
                 max_tokens=1500,  # Increased to allow up to 1000 words
-                temperature=0.8
+                temperature=0.8,
+                stream=True
             )
-            return response.choices[0].message.content.strip()
+            return render_stream(stream)
+        
+        # Identical concurrent requests (double clicks, same story open in two tabs) share one API call
+        request_key = hashlib.sha256(f"{model}\n{user_prompt}".encode()).hexdigest()
+        with st.spinner(f"🎭 Creating a {style_direction} continuation at {writing_level} level..."):
+            return coalesce_request(request_key, request_chapter)
     
     except Exception as e:
-        return f"❌ Error generating chapter: {str(e)}"
+        # Surface the failure instead of returning it as chapter text that would be saved
+        st.error(f"❌ Error generating chapter: {str(e)}")
+        return None
+
+RATING_SYSTEM_PROMPT = """You are a supportive and encouraging writing teacher. Rate the following text on a scale of 1-5 (5 being excellent).
+
+Respond with a JSON object with exactly these keys:
+"rating": an integer from 1 to 5
+"strengths": what the writer did well - be specific and encouraging
+"improvements": constructive suggestions - be gentle and positive
+
+Consider: creativity, flow, grammar, character development, dialogue, and engagement.
+Remember to be encouraging and age-appropriate in your feedback."""
+
+RATING_UNAVAILABLE = "Unable to rate at this time"
+RATING_CACHE_SIZE = 256
+
+@st.cache_resource
+def get_rating_cache():
+    """LRU of recent ratings keyed by a hash of the rated text, shared by all sessions"""
+    return collections.OrderedDict(), threading.Lock()
 
 def rate_user_writing(client, user_text):
     """AI rates user's writing (1-5 scale) with detailed feedback"""
     try:
         response = client.chat.completions.create(
-            model="gpt-4o-mini",
+            model=RATING_MODEL,
             messages=[
-                {"role": "system", "content": """You are a supportive and encouraging writing teacher. Rate the following text on a scale of 1-5 (5 being excellent).
-                
-                Provide your response in this format:
-                Rating: [number]
-                Strengths: [What the writer did well - be specific and encouraging]
-                Areas for improvement: [Constructive suggestions - be gentle and positive]
-                
-                Consider: creativity, flow, grammar, character development, dialogue, and engagement.
-                Remember to be encouraging and age-appropriate in your feedback."""},
+                {"role": "system", "content": RATING_SYSTEM_PROMPT},
                 {"role": "user", "content": f"Rate this writing: {user_text}"}
             ],
-            max_tokens=200,
+            response_format={"type": "json_object"},
+            max_tokens=300,
             temperature=0.3
         )
-        result = response.choices[0].message.content.strip()
-        
-        # Extract rating number
-        rating = 3  # default
-        if "Rating:" in result:
-            try:
-                rating_line = result.split('\n')[0]
-                rating = int(rating_line.split(':')[1].strip())
-            except:
-                pass
+        data = json.loads(response.choices[0].message.content)
+        rating = min(max(int(data["rating"]), 1), 5)
         
+        # Keep the readable feedback format shown in the UI and stored with chapters
+        result = (f"Rating: {rating}\n"
+                  f"Strengths: {data.get('strengths', '')}\n"
+                  f"Areas for improvement: {data.get('improvements', '')}")
         return rating, result
     except:
-        return 3, "Unable to rate at this time"
+        return 3, RATING_UNAVAILABLE
+
+def submit_rating(client, user_text):
+    """Rate text on the AI thread pool, reusing the cached rating for the same words"""
+    # Cache lookups happen here on the script thread; the worker only fills the cache
+    cache, lock = get_rating_cache()
+    # Key on the model and the text with whitespace normalised, so resubmitting the
+    # same words with different spacing or line breaks also hits the cache
+    normalized = " ".join(user_text.split())
+    key = hashlib.blake2b(f"{RATING_MODEL}\n{normalized}".encode(), digest_size=16).hexdigest()
+    with lock:
+        cached = cache.get(key)
+        if cached is not None:
+            cache.move_to_end(key)
+    if cached is None:
+        # Fall back to ratings saved by earlier processes
+        row = get_read_conn().execute(SQL_GET_SAVED_RATING, (key,)).fetchone()
+        if row is not None:
+            cached = tuple(row)
+            with lock:
+                cache[key] = cached
+                if len(cache) > RATING_CACHE_SIZE:
+                    cache.popitem(last=False)
+    if cached is not None:
+        future = concurrent.futures.Future()
+        future.set_result(cached)
+        return future
+    
+    # Resolved here because cached resources shouldn't be looked up from worker threads
+    write_queue = get_write_queue()
+    
+    def rate():
+        rating = rate_user_writing(client, user_text)
+        # Failed ratings are not cached so the next attempt retries
+        if rating[1] != RATING_UNAVAILABLE:
+            with lock:
+                cache[key] = rating
+                if len(cache) > RATING_CACHE_SIZE:
+                    cache.popitem(last=False)
+            # Best effort and not tied to a session: a failed save is only logged.
+            # Only a cache fill, so it doesn't invalidate cached reads
+            write_queue.put((concurrent.futures.Future(), ((SQL_SAVE_RATING, (key, rating[0], rating[1])),), False))
+        return rating
+    
+    return get_ai_executor().submit(rate)
+
+# Static like CHAPTER_SYSTEM_PROMPT; the feedback-derived context goes in the user message
+POLISH_SYSTEM_PROMPT = """You are an expert editor helping improve writing quality.
+
+Tasks:
+1. Improve grammar, flow, and clarity
+2. Enhance word choice and sentence structure
+3. Maintain the author's voice and style
+4. Fix any errors
+5. Make it more engaging while keeping the core meaning
+6. Keep polished text under 1,000 words
+
+Preserve the original length and meaning. Do not exceed the original length by more than 10%."""
 
-def polish_writing(client, original_text, previous_ratings):
+def polish_writing(client, original_text, previous_ratings, model=POLISH_MODEL):
     """Polish user's writing and provide improvements"""
     try:
         # Adapt based on previous feedback
         rating_context = ""
-        if previous_ratings:
-            avg_rating = sum([r[0] for r in previous_ratings if r[0]]) / len([r for r in previous_ratings if r[0]])
-            feedbacks = [r[1] for r in previous_ratings if r[1]]
-            if avg_rating < 3:
-                rating_context = "The user has been unsatisfied with previous edits. Be more conservative and focus on clear improvements. "
-            if feedbacks:
-                rating_context += f"Previous feedback: {'; '.join(feedbacks[-2:])}. "
+        ratings = [r[0] for r in previous_ratings if r[0]]
+        if ratings and sum(ratings) / len(ratings) < 3:
+            rating_context = "The user has been unsatisfied with previous edits. Be more conservative and focus on clear improvements. "
+        feedbacks = [r[1] for r in previous_ratings if r[1]]
+        if feedbacks:
+            rating_context += f"Previous feedback: {'; '.join(feedbacks[-2:])}. "
 
-        system_prompt = f"""You are an expert editor helping improve writing quality.
-        {rating_context}
-        
-        Tasks:
-        1. Improve grammar, flow, and clarity
-        2. Enhance word choice and sentence structure
-        3. Maintain the author's voice and style
-        4. Fix any errors
-        5. Make it more engaging while keeping the core meaning
-        6. Keep polished text under 1,000 words
-        
-        Preserve the original length and meaning. Do not exceed the original length by more than 10%."""
-        
         with st.spinner("✨ Polishing your writing..."):
-            response = client.chat.completions.create(
-                model="gpt-4o",
+            stream = client.chat.completions.create(
+                model=model,
                 messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": f"Please polish and improve this text: {original_text}"}
+                    {"role": "system", "content": POLISH_SYSTEM_PROMPT},
+                    {"role": "user", "content": f"{rating_context}Please polish and improve this text: {original_text}"}
                 ],
                 max_tokens=800,
-                temperature=0.4
+                temperature=0.4,
+                stream=True
             )
-            return response.choices[0].message.content.strip()
+            return render_stream(stream)
     
     except Exception as e:
-        return f"❌ Error polishing text: {str(e)}"
+        st.error(f"❌ Error polishing text: {str(e)}")
+        return None
+
+# Rendering helpers
+STARS = ('', '⭐', '⭐⭐', '⭐⭐⭐', '⭐⭐⭐⭐', '⭐⭐⭐⭐⭐')  # indexed by a 0-5 rating
+
+def format_date(epoch_ms):
+    """Format an epoch-milliseconds timestamp as a local YYYY-MM-DD date"""
+    return datetime.datetime.fromtimestamp(epoch_ms / 1000).strftime('%Y-%m-%d')
+
+def quote_markdown(text):
+    """Format text as a markdown blockquote, keeping multi-line text inside the quote"""
+    return "> " + text.replace("\n", "\n> ")
 
 # Initialize session state
 def init_session_state():
@@ -347,6 +819,8 @@ def init_session_state():
         st.session_state.story_mode = 'new'
     if 'pending_ai_continuation' not in st.session_state:
         st.session_state.pending_ai_continuation = False
+    if 'ai_continuation_failed' not in st.session_state:
+        st.session_state.ai_continuation_failed = False
     if 'temp_user_chapter' not in st.session_state:
         st.session_state.temp_user_chapter = ""
     if 'temp_ai_style' not in st.session_state:
@@ -379,15 +853,28 @@ def main():
     # Sidebar navigation - Updated order
     with st.sidebar:
         st.header("📚 Navigation")
-        mode = st.radio("Choose mode:", ["✨ Text Polishing", "📖 Story Writing", "📊 Story List"])
+        mode = st.radio("Choose mode:", ["✨ Text Polishing", "📖 Story Writing", "📊 Story List"], key="mode")
+        if mode == "✨ Text Polishing":
+            polish_quality = st.selectbox("Polish quality", list(POLISH_MODEL_CHOICES),
+                                          index=list(POLISH_MODEL_CHOICES.values()).index(POLISH_MODEL))
     
     if mode == "✨ Text Polishing":
-        text_polishing_mode(client)
+        text_polishing_mode(client, POLISH_MODEL_CHOICES[polish_quality])
     elif mode == "📖 Story Writing":
         story_writing_mode(client)
     else:
         story_list_mode()
 
+def set_current_story(story_id):
+    """Switch the current story, dropping any continuation queued for the previous one"""
+    st.session_state.current_story_id = story_id
+    st.session_state.pending_ai_continuation = False
+    st.session_state.ai_continuation_failed = False
+
+def select_ai_option(key, value):
+    """Record a style or level pick; runs before the button's own rerun"""
+    st.session_state[key] = value
+
 def story_writing_mode(client):
     st.header("📖 Collaborative Story Writing")
     
@@ -396,7 +883,7 @@ def story_writing_mode(client):
     with col1:
         if st.button("➕ Create New Story", type="primary" if st.session_state.story_mode == 'new' else "secondary"):
             st.session_state.story_mode = 'new'
-            st.session_state.current_story_id = None
+            set_current_story(None)
             st.rerun()
     
     with col2:
@@ -431,7 +918,7 @@ def story_writing_mode(client):
                     if 'selected_ai_style' in st.session_state and 'selected_ai_level' in st.session_state:
                         # Create story
                         story_id = create_story(story_title, user_text)
-                        st.session_state.current_story_id = story_id
+                        set_current_story(story_id)
                         st.session_state.story_mode = 'continue'
                         st.session_state.temp_user_chapter = user_text
                         st.session_state.temp_ai_style = st.session_state.selected_ai_style
@@ -444,32 +931,28 @@ def story_writing_mode(client):
                 col1, col2, col3, col4 = st.columns(4)
                 
                 with col1:
-                    if st.button("😂 Funny", 
-                               type="primary" if st.session_state.get('selected_ai_style') == 'funny' else "secondary",
-                               use_container_width=True):
-                        st.session_state.selected_ai_style = 'funny'
-                        st.rerun()
+                    st.button("😂 Funny",
+                              type="primary" if st.session_state.get('selected_ai_style') == 'funny' else "secondary",
+                              use_container_width=True,
+                              on_click=select_ai_option, args=('selected_ai_style', 'funny'))
                 
                 with col2:
-                    if st.button("👻 Spooky", 
-                               type="primary" if st.session_state.get('selected_ai_style') == 'spooky' else "secondary",
-                               use_container_width=True):
-                        st.session_state.selected_ai_style = 'spooky'
-                        st.rerun()
+                    st.button("👻 Spooky",
+                              type="primary" if st.session_state.get('selected_ai_style') == 'spooky' else "secondary",
+                              use_container_width=True,
+                              on_click=select_ai_option, args=('selected_ai_style', 'spooky'))
                 
                 with col3:
-                    if st.button("🎲 Surprise", 
-                               type="primary" if st.session_state.get('selected_ai_style') == 'surprise' else "secondary",
-                               use_container_width=True):
-                        st.session_state.selected_ai_style = 'surprise'
-                        st.rerun()
+                    st.button("🎲 Surprise",
+                              type="primary" if st.session_state.get('selected_ai_style') == 'surprise' else "secondary",
+                              use_container_width=True,
+                              on_click=select_ai_option, args=('selected_ai_style', 'surprise'))
                 
                 with col4:
-                    if st.button("✨ Creative", 
-                               type="primary" if st.session_state.get('selected_ai_style') == 'creative' else "secondary",
-                               use_container_width=True):
-                        st.session_state.selected_ai_style = 'creative'
-                        st.rerun()
+                    st.button("✨ Creative",
+                              type="primary" if st.session_state.get('selected_ai_style') == 'creative' else "secondary",
+                              use_container_width=True,
+                              on_click=select_ai_option, args=('selected_ai_style', 'creative'))
                 
                 # Initialize default style if not set
                 if 'selected_ai_style' not in st.session_state:
@@ -480,28 +963,25 @@ def story_writing_mode(client):
                 col1, col2, col3 = st.columns(3)
                 
                 with col1:
-                    if st.button("📚 Professional Author", 
-                               type="primary" if st.session_state.get('selected_ai_level') == 'professional' else "secondary",
-                               use_container_width=True,
-                               help="Complex vocabulary and sophisticated writing"):
-                        st.session_state.selected_ai_level = 'professional'
-                        st.rerun()
+                    st.button("📚 Professional Author",
+                              type="primary" if st.session_state.get('selected_ai_level') == 'professional' else "secondary",
+                              use_container_width=True,
+                              help="Complex vocabulary and sophisticated writing",
+                              on_click=select_ai_option, args=('selected_ai_level', 'professional'))
                 
                 with col2:
-                    if st.button("🎓 College Student", 
-                               type="primary" if st.session_state.get('selected_ai_level') == 'college' else "secondary",
-                               use_container_width=True,
-                               help="Clear, engaging writing for young adults"):
-                        st.session_state.selected_ai_level = 'college'
-                        st.rerun()
+                    st.button("🎓 College Student",
+                              type="primary" if st.session_state.get('selected_ai_level') == 'college' else "secondary",
+                              use_container_width=True,
+                              help="Clear, engaging writing for young adults",
+                              on_click=select_ai_option, args=('selected_ai_level', 'college'))
                 
                 with col3:
-                    if st.button("🎒 Middle Schooler", 
-                               type="primary" if st.session_state.get('selected_ai_level') == 'middle_school' else "secondary",
-                               use_container_width=True,
-                               help="Simple, fun writing that's easy to read"):
-                        st.session_state.selected_ai_level = 'middle_school'
-                        st.rerun()
+                    st.button("🎒 Middle Schooler",
+                              type="primary" if st.session_state.get('selected_ai_level') == 'middle_school' else "secondary",
+                              use_container_width=True,
+                              help="Simple, fun writing that's easy to read",
+                              on_click=select_ai_option, args=('selected_ai_level', 'middle_school'))
                 
                 # Initialize default level if not set
                 if 'selected_ai_level' not in st.session_state:
@@ -516,12 +996,13 @@ def story_writing_mode(client):
             # Select story to continue
             stories = get_stories()
             if stories:
-                story_options = [f"{s[1]}" for s in stories]
-                selected_title = st.selectbox("Select a story to continue:", story_options)
+                # Select by id so duplicate titles stay distinct and no label parsing is needed
+                story_titles = {s[0]: s[1] for s in stories}
+                selected_story_id = st.selectbox("Select a story to continue:", list(story_titles),
+                                                 format_func=story_titles.get)
                 
                 if st.button("📖 Load Story"):
-                    selected_idx = story_options.index(selected_title)
-                    st.session_state.current_story_id = stories[selected_idx][0]
+                    set_current_story(selected_story_id)
                     st.rerun()
             else:
                 st.info("No stories found. Create a new story first!")
@@ -533,41 +1014,58 @@ def story_writing_mode(client):
             if story_details:
                 st.markdown(f"## 📚 {story_details[0]}")
                 
-                # Handle pending AI continuation from new story creation
-                if st.session_state.pending_ai_continuation:
+                # Handle pending AI continuation from new story creation. Only a story
+                # without chapters can take it, so it never adds a second chapter 1
+                if st.session_state.pending_ai_continuation and not chapters:
+                    # Cleared up front so a later rerun never re-issues the paid calls, and
+                    # marked failed until the chapter is saved, so an attempt cut short by a
+                    # rerun or stop mid-stream still offers a retry
+                    st.session_state.pending_ai_continuation = False
+                    st.session_state.ai_continuation_failed = True
                     # The original text is already in story_details[1], so we rate that
-                    # Rate user's writing
-                    user_rating_score, user_rating_text = rate_user_writing(client, story_details[1])
+                    # Rate user's writing in the background while the continuation streams
+                    rating_future = submit_rating(client, story_details[1])
                     
                     # Generate AI continuation for the original text
                     ai_chapter = generate_next_chapter(client, story_details[1], 
                                                      story_details[1], 
                                                      st.session_state.temp_ai_style,
                                                      st.session_state.temp_ai_level, [])
+                    user_rating_score, user_rating_text = rating_future.result()
                     
-                    # Save as first chapter - but use empty string for user_content since original is in stories table
-                    add_chapter(st.session_state.current_story_id, 1, 
-                              "", ai_chapter, 
-                              st.session_state.temp_ai_style, 
-                              st.session_state.temp_ai_level,
-                              user_rating_score)
-                    
-                    # Store AI feedback for Chapter 1 (the original opening)
-                    store_ai_feedback(st.session_state.current_story_id, 1, user_rating_text)
+                    if ai_chapter is not None:
+                        # Save as first chapter - but use empty string for user_content since original is in stories table.
+                        # Its feedback is the AI's feedback on Chapter 1 (the original opening)
+                        try:
+                            add_chapter(st.session_state.current_story_id, 1, 
+                                      "", ai_chapter, 
+                                      st.session_state.temp_ai_style, 
+                                      st.session_state.temp_ai_level,
+                                      user_rating_score, user_rating_text)
+                        except sqlite3.Error as e:
+                            st.error(f"❌ Error saving chapter: {str(e)}")
+                            st.stop()
+                        st.session_state.ai_continuation_failed = False
                     
-                    # Store the feedback in session state to display
-                    st.session_state.initial_feedback = user_rating_text
-                    st.session_state.pending_ai_continuation = False
-                    st.session_state.temp_user_chapter = ""
-                    st.session_state.temp_ai_style = "creative"
-                    st.session_state.temp_ai_level = "middle_school"
-                    st.rerun()
+                        # Store the feedback in session state to display
+                        st.session_state.initial_feedback = user_rating_text
+                        st.session_state.temp_user_chapter = ""
+                        st.session_state.temp_ai_style = "creative"
+                        st.session_state.temp_ai_level = "middle_school"
+                        st.rerun()
+                
+                # Only an explicit click retries a failed continuation
+                if st.session_state.ai_continuation_failed and not chapters:
+                    if st.button("🔄 Retry AI continuation"):
+                        st.session_state.ai_continuation_failed = False
+                        st.session_state.pending_ai_continuation = True
+                        st.rerun()
                 
                 # Show initial feedback if available
                 if 'initial_feedback' in st.session_state:
                     st.info(f"💭 AI feedback on your Chapter 1: {st.session_state.initial_feedback}")
                     if chapters:
-                        ai_level = chapters[0][6] if len(chapters[0]) > 6 else 'middle_school'
+                        ai_level = chapters[0]["ai_level"]
                         level_display = {"professional": "Professional Author", "college": "College Student", "middle_school": "Middle Schooler"}.get(ai_level, "Middle Schooler")
                         st.markdown(f"📝 AI wrote Chapter 2 at **{level_display}** level")
                     del st.session_state.initial_feedback
@@ -578,24 +1076,23 @@ def story_writing_mode(client):
                 with col_left:
                     st.markdown("### ✍️ Your Writing")
                     
-                    # Display original start as Chapter 1
-                    st.markdown("**Chapter 1**")
-                    # Check if there's stored feedback for the original opening
-                    opening_feedback = get_ai_feedback(st.session_state.current_story_id, 1)
+                    # Build the whole chapter history as one markdown block instead of
+                    # several elements per chapter
+                    history = ["**Chapter 1**"]
+                    # Feedback comes with the chapter rows; the first row carries the opening's
+                    opening_feedback = chapters[0]["feedback"] if chapters else None
                     if opening_feedback and chapters:  # Only show if we have chapters (meaning it was rated)
                         # Extract rating from first chapter if available
-                        if chapters and chapters[0][5]:
-                            st.markdown(f"🤖 AI Rating: {'⭐' * chapters[0][5]}")
-                        st.info(f"💭 AI Feedback: {opening_feedback}")
-                    st.markdown(f"{story_details[1]}")
-                    st.divider()
+                        if chapters and chapters[0]["ai_rating"]:
+                            history.append(f"🤖 AI Rating: {STARS[chapters[0]['ai_rating']]}")
+                        history.append(quote_markdown(f"💭 AI Feedback: {opening_feedback}"))
+                    history.append(f"{story_details[1]}\n\n---")
                     
                     # Display user chapters (starting from chapter 3 if there are more chapters)
                     displayed_user_chapters = 0
-                    for idx, chapter_data in enumerate(chapters):
-                        ch_num = chapter_data[0]
-                        user_content = chapter_data[1]
-                        ai_rating = chapter_data[5]
+                    for idx, chapter in enumerate(chapters):
+                        user_content = chapter["user_content"]
+                        ai_rating = chapter["ai_rating"]
                         
                         if idx == 0 and not user_content:
                             # Skip first record if it's empty (original is in story_details)
@@ -603,15 +1100,15 @@ def story_writing_mode(client):
                         
                         displayed_user_chapters += 1
                         user_chapter_num = displayed_user_chapters * 2 + 1  # User chapters: 3, 5, 7...
-                        st.markdown(f"**Chapter {user_chapter_num}**")
+                        history.append(f"**Chapter {user_chapter_num}**")
                         if ai_rating:
-                            st.markdown(f"🤖 AI Rating: {'⭐' * ai_rating}")
+                            history.append(f"🤖 AI Rating: {STARS[ai_rating]}")
                             # Get and display AI feedback
-                            feedback = get_ai_feedback(st.session_state.current_story_id, user_chapter_num)
+                            feedback = chapter["feedback"]
                             if feedback:
-                                st.info(f"💭 AI Feedback: {feedback}")
-                        st.markdown(f"{user_content}")
-                        st.divider()
+                                history.append(quote_markdown(f"💭 AI Feedback: {feedback}"))
+                        history.append(f"{user_content}\n\n---")
+                    st.markdown("\n\n".join(history))
                     
                     # New chapter input
                     st.markdown("### ✍️ Write Next Chapter")
@@ -629,16 +1126,12 @@ def story_writing_mode(client):
                                help="Write at least 200 words to enable AI continuation" if button_disabled else "Generate AI continuation",
                                key="continue_story_btn"):
                         if 'selected_ai_style' in st.session_state and 'selected_ai_level' in st.session_state:
-                            # Build story context
-                            context = story_details[1] + "\n\n"
-                            for chapter_data in chapters:
-                                ch_num = chapter_data[0]
-                                user_cont = chapter_data[1]
-                                ai_cont = chapter_data[2]
-                                context += f"Chapter {ch_num}: {user_cont}\n{ai_cont}\n\n"
+                            # Build story context from the opening plus the most recent chapters
+                            context = build_story_context(story_details[1], 
+                                                          get_recent_chapters(st.session_state.current_story_id))
                             
-                            # Rate user's writing
-                            user_rating_score, user_rating_text = rate_user_writing(client, new_chapter)
+                            # Rate user's writing in the background while the continuation streams
+                            rating_future = submit_rating(client, new_chapter)
                             
                             # Get previous ratings
                             previous_ratings = get_user_rating_history(st.session_state.current_story_id)
@@ -648,64 +1141,60 @@ def story_writing_mode(client):
                                                              st.session_state.selected_ai_style,
                                                              st.session_state.selected_ai_level,
                                                              previous_ratings)
+                            user_rating_score, user_rating_text = rating_future.result()
                             
-                            # Save chapter
-                            next_chapter_num = len(chapters) + 1
-                            add_chapter(st.session_state.current_story_id, next_chapter_num, 
-                                      new_chapter, ai_chapter, st.session_state.selected_ai_style,
-                                      st.session_state.selected_ai_level, user_rating_score)
+                            # Only save when generation succeeded; errors were already shown
+                            if ai_chapter is not None:
+                                # Save chapter together with the AI feedback on the user's writing
+                                next_chapter_num = len(chapters) + 1
+                                try:
+                                    add_chapter(st.session_state.current_story_id, next_chapter_num, 
+                                              new_chapter, ai_chapter, st.session_state.selected_ai_style,
+                                              st.session_state.selected_ai_level, user_rating_score,
+                                              user_rating_text)
+                                except sqlite3.Error as e:
+                                    st.error(f"❌ Error saving chapter: {str(e)}")
+                                    st.stop()
+                                # User chapters are numbered 3, 5, 7... after the original opening
+                                user_chapter_num = next_chapter_num * 2 - 1
                             
-                            # Store AI feedback
-                            # If this is the first user continuation (after the original), it's chapter 3
-                            # Otherwise, calculate based on how many chapters exist
-                            if len(chapters) == 1:
-                                user_chapter_num = 3  # First user continuation after original
-                            else:
-                                user_chapter_num = len(chapters) * 2 + 1
-                            
-                            store_ai_feedback(st.session_state.current_story_id, user_chapter_num, user_rating_text)
-                            
-                            st.success(f"✅ Chapter {user_chapter_num} (your writing) and Chapter {user_chapter_num + 1} (AI continuation) created!")
-                            st.info(f"💭 AI feedback on your writing: {user_rating_text}")
-                            level_display = {"professional": "Professional Author", "college": "College Student", "middle_school": "Middle Schooler"}.get(st.session_state.selected_ai_level, "Middle Schooler")
-                            st.markdown(f"📝 AI wrote at **{level_display}** level with **{st.session_state.selected_ai_style}** style")
-                            st.rerun()
+                                st.success(f"✅ Chapter {user_chapter_num} (your writing) and Chapter {user_chapter_num + 1} (AI continuation) created!")
+                                st.info(f"💭 AI feedback on your writing: {user_rating_text}")
+                                level_display = {"professional": "Professional Author", "college": "College Student", "middle_school": "Middle Schooler"}.get(st.session_state.selected_ai_level, "Middle Schooler")
+                                st.markdown(f"📝 AI wrote at **{level_display}** level with **{st.session_state.selected_ai_style}** style")
+                                st.rerun()
                     
                     # AI style selection - always visible
                     st.markdown("### Tell AI what you want:")
                     col1, col2, col3, col4 = st.columns(4)
                     
                     with col1:
-                        if st.button("😂 Funny", 
-                                   type="primary" if st.session_state.get('selected_ai_style') == 'funny' else "secondary",
-                                   use_container_width=True,
-                                   key="funny_btn"):
-                            st.session_state.selected_ai_style = 'funny'
-                            st.rerun()
+                        st.button("😂 Funny",
+                                  type="primary" if st.session_state.get('selected_ai_style') == 'funny' else "secondary",
+                                  use_container_width=True,
+                                  key="funny_btn",
+                                  on_click=select_ai_option, args=('selected_ai_style', 'funny'))
                     
                     with col2:
-                        if st.button("👻 Spooky", 
-                                   type="primary" if st.session_state.get('selected_ai_style') == 'spooky' else "secondary",
-                                   use_container_width=True,
-                                   key="spooky_btn"):
-                            st.session_state.selected_ai_style = 'spooky'
-                            st.rerun()
+                        st.button("👻 Spooky",
+                                  type="primary" if st.session_state.get('selected_ai_style') == 'spooky' else "secondary",
+                                  use_container_width=True,
+                                  key="spooky_btn",
+                                  on_click=select_ai_option, args=('selected_ai_style', 'spooky'))
                     
                     with col3:
-                        if st.button("🎲 Surprise", 
-                                   type="primary" if st.session_state.get('selected_ai_style') == 'surprise' else "secondary",
-                                   use_container_width=True,
-                                   key="surprise_btn"):
-                            st.session_state.selected_ai_style = 'surprise'
-                            st.rerun()
+                        st.button("🎲 Surprise",
+                                  type="primary" if st.session_state.get('selected_ai_style') == 'surprise' else "secondary",
+                                  use_container_width=True,
+                                  key="surprise_btn",
+                                  on_click=select_ai_option, args=('selected_ai_style', 'surprise'))
                     
                     with col4:
-                        if st.button("✨ Creative", 
-                                   type="primary" if st.session_state.get('selected_ai_style') == 'creative' else "secondary",
-                                   use_container_width=True,
-                                   key="creative_btn"):
-                            st.session_state.selected_ai_style = 'creative'
-                            st.rerun()
+                        st.button("✨ Creative",
+                                  type="primary" if st.session_state.get('selected_ai_style') == 'creative' else "secondary",
+                                  use_container_width=True,
+                                  key="creative_btn",
+                                  on_click=select_ai_option, args=('selected_ai_style', 'creative'))
                     
                     # Initialize default style if not set
                     if 'selected_ai_style' not in st.session_state:
@@ -716,31 +1205,28 @@ def story_writing_mode(client):
                     col1, col2, col3 = st.columns(3)
                     
                     with col1:
-                        if st.button("📚 Professional Author", 
-                                   type="primary" if st.session_state.get('selected_ai_level') == 'professional' else "secondary",
-                                   use_container_width=True,
-                                   key="prof_btn",
-                                   help="Complex vocabulary and sophisticated writing"):
-                            st.session_state.selected_ai_level = 'professional'
-                            st.rerun()
+                        st.button("📚 Professional Author",
+                                  type="primary" if st.session_state.get('selected_ai_level') == 'professional' else "secondary",
+                                  use_container_width=True,
+                                  key="prof_btn",
+                                  help="Complex vocabulary and sophisticated writing",
+                                  on_click=select_ai_option, args=('selected_ai_level', 'professional'))
                     
                     with col2:
-                        if st.button("🎓 College Student", 
-                                   type="primary" if st.session_state.get('selected_ai_level') == 'college' else "secondary",
-                                   use_container_width=True,
-                                   key="college_btn",
-                                   help="Clear, engaging writing for young adults"):
-                            st.session_state.selected_ai_level = 'college'
-                            st.rerun()
+                        st.button("🎓 College Student",
+                                  type="primary" if st.session_state.get('selected_ai_level') == 'college' else "secondary",
+                                  use_container_width=True,
+                                  key="college_btn",
+                                  help="Clear, engaging writing for young adults",
+                                  on_click=select_ai_option, args=('selected_ai_level', 'college'))
                     
                     with col3:
-                        if st.button("🎒 Middle Schooler", 
-                                   type="primary" if st.session_state.get('selected_ai_level') == 'middle_school' else "secondary",
-                                   use_container_width=True,
-                                   key="middle_btn",
-                                   help="Simple, fun writing that's easy to read"):
-                            st.session_state.selected_ai_level = 'middle_school'
-                            st.rerun()
+                        st.button("🎒 Middle Schooler",
+                                  type="primary" if st.session_state.get('selected_ai_level') == 'middle_school' else "secondary",
+                                  use_container_width=True,
+                                  key="middle_btn",
+                                  help="Simple, fun writing that's easy to read",
+                                  on_click=select_ai_option, args=('selected_ai_level', 'middle_school'))
                     
                     # Initialize default level if not set
                     if 'selected_ai_level' not in st.session_state:
@@ -754,45 +1240,40 @@ def story_writing_mode(client):
                         st.info("💡 AI will continue your story after you select a style and writing level below")
                     else:
                         # All AI chapters
-                        displayed_ai_chapters = 0
-                        for idx, chapter_data in enumerate(chapters):
-                            ch_num = chapter_data[0]
-                            user_content = chapter_data[1]
-                            ai_content = chapter_data[2]
-                            ai_style = chapter_data[3]
-                            user_rating = chapter_data[4]
-                            ai_level = chapter_data[6] if len(chapter_data) > 6 else 'middle_school'
-
-                            displayed_ai_chapters += 1
-
-                            if displayed_ai_chapters == 1:
-                                ai_chapter_num = 2
-                            else:
-                                ai_chapter_num = displayed_ai_chapters * 2
+                        for displayed_ai_chapters, chapter in enumerate(chapters, 1):
+                            ch_num = chapter["chapter_number"]
+                            ai_content = chapter["ai_content"]
+                            ai_style = chapter["ai_style"]
+                            user_rating = chapter["user_rating"]
+                            ai_level = chapter["ai_level"]
+                            # AI chapters: 2, 4, 6...
+                            ai_chapter_num = displayed_ai_chapters * 2
 
                             level_display = {"professional": "Professional", "college": "College", "middle_school": "Middle School"}.get(ai_level, "Middle School")
-                            st.markdown(f"**Chapter {ai_chapter_num}** ({ai_style}, {level_display} level)")
+                            header = f"**Chapter {ai_chapter_num}** ({ai_style}, {level_display} level)"
+                            body = f"{ai_content}\n\n*Word count: {len(ai_content.split())}*\n\n---"
 
                             if user_rating:
-                                st.markdown(f"👤 Your Rating: {'⭐' * user_rating}")
+                                st.markdown(f"{header}\n\n👤 Your Rating: {STARS[user_rating]}\n\n{body}")
                             else:
-                                col_a, col_b = st.columns([2, 1])
-                                with col_a:
-                                    rating = st.selectbox(f"Rate this chapter:", 
-                                                         [None, 1, 2, 3, 4, 5], 
-                                                         key=f"rate_ch_{ch_num}_unique")
-                                with col_b:
-                                    if rating and st.button("Submit", key=f"submit_ch_{ch_num}_unique"):
-                                        update_chapter_rating(st.session_state.current_story_id, 
-                                                              ch_num, rating)
-                                        st.rerun()
-
-                            st.markdown(f"{ai_content}")
-                            st.caption(f"Word count: {len(ai_content.split())}")
-                            st.divider()
+                                st.markdown(header)
+                                # A form so picking a rating doesn't rerun the script until Submit
+                                with st.form(f"rate_form_ch_{ch_num}"):
+                                    col_a, col_b = st.columns([2, 1])
+                                    with col_a:
+                                        rating = st.selectbox(f"Rate this chapter:", 
+                                                             [None, 1, 2, 3, 4, 5], 
+                                                             key=f"rate_ch_{ch_num}_unique")
+                                    with col_b:
+                                        submitted = st.form_submit_button("Submit")
+                                if submitted and rating:
+                                    update_chapter_rating(st.session_state.current_story_id, 
+                                                          ch_num, rating)
+                                    st.rerun()
+                                st.markdown(body)
                             
                         
-def text_polishing_mode(client):
+def text_polishing_mode(client, polish_model):
     st.header("✨ Text Polishing Studio")
     st.markdown("*Get AI feedback and improvements on your writing*")
     
@@ -801,46 +1282,48 @@ def text_polishing_mode(client):
     
     with col1:
         st.markdown("### 📝 Your Original Text")
-        original_text = st.text_area("Write or paste your text here:", height=400,
-                                   placeholder="Enter the text you'd like to improve...")
+        # Edits are only sent when the form is submitted, not on every change
+        with st.form("polish_form"):
+            original_text = st.text_area("Write or paste your text here:", height=400,
+                                       placeholder="Enter the text you'd like to improve...")
+            polish_requested = st.form_submit_button("✨ Polish My Writing", type="primary")
         
         if original_text:
             st.markdown(f"**Word count:** {len(original_text.split())}")
+    
+    with col2:
+        st.markdown("### ✨ AI Enhanced Version")
+        
+        if original_text and polish_requested:
+            # Get rating history for this polishing
+            previous_ratings = get_user_rating_history(st.session_state.current_story_id or 0)
             
-            if st.button("✨ Polish My Writing", type="primary"):
-                # Get rating history for this polishing
-                previous_ratings = get_user_rating_history(st.session_state.current_story_id or 0)
-                
-                # Rate original text
-                ai_rating_score, ai_rating_text = rate_user_writing(client, original_text)
-                
-                # Polish the text
-                polished_text = polish_writing(client, original_text, previous_ratings)
-                
-                # Save polish session
+            # Rate original text in the background while the polish streams
+            rating_future = submit_rating(client, original_text)
+            
+            # Stream the polish into a temporary slot; the saved session below
+            # replaces it in this same run, so no st.rerun() is needed
+            stream_slot = st.empty()
+            with stream_slot.container():
+                polished_text = polish_writing(client, original_text, previous_ratings, polish_model)
+            ai_rating_score, ai_rating_text = rating_future.result()
+            
+            # Save polish session (errors were already shown)
+            if polished_text is not None:
+                stream_slot.empty()
                 session_id = add_polish_session(st.session_state.current_story_id or 0, 
                                               original_text, polished_text, ai_rating_score)
                 st.session_state.current_polish_session = session_id
-                
-                st.rerun()
-    
-    with col2:
-        st.markdown("### ✨ AI Enhanced Version")
         
         if st.session_state.current_polish_session:
             # Display polished text
-            conn = sqlite3.connect('writing_sessions.db')
-            c = conn.cursor()
-            c.execute("SELECT original_text, polished_text, ai_rating FROM polish_sessions WHERE id = ?", 
-                     (st.session_state.current_polish_session,))
-            result = c.fetchone()
-            conn.close()
+            result = get_polish_session(st.session_state.current_polish_session)
             
             if result:
                 polished_text = result[1]
                 ai_rating = result[2]
                 
-                st.markdown(f"🤖 **AI's rating of your original:** {'⭐' * ai_rating}/5")
+                st.markdown(f"🤖 **AI's rating of your original:** {STARS[ai_rating]}/5")
                 st.divider()
                 st.markdown(polished_text)
                 st.markdown(f"**Word count:** {len(polished_text.split())}")
@@ -849,116 +1332,127 @@ def text_polishing_mode(client):
                 st.divider()
                 st.markdown("### 📊 Rate the AI's Polish")
                 
-                col_a, col_b = st.columns(2)
-                with col_a:
-                    user_rating = st.selectbox("Your rating:", [None, 1, 2, 3, 4, 5])
-                with col_b:
-                    if user_rating:
+                with st.form("polish_rating_form"):
+                    col_a, col_b = st.columns(2)
+                    with col_a:
+                        user_rating = st.selectbox("Your rating:", [None, 1, 2, 3, 4, 5])
+                    with col_b:
                         feedback = st.text_input("Optional feedback:", 
                                                placeholder="What could be better?")
-                        if st.button("Submit Rating"):
-                            update_polish_rating(st.session_state.current_polish_session, 
-                                               user_rating, feedback)
-                            st.success("Thanks for your feedback! AI will improve.")
-                            st.session_state.current_polish_session = None
-                            st.rerun()
+                    submitted = st.form_submit_button("Submit Rating")
+                if submitted and user_rating:
+                    update_polish_rating(st.session_state.current_polish_session, 
+                                       user_rating, feedback)
+                    st.success("Thanks for your feedback! AI will improve.")
+                    st.session_state.current_polish_session = None
+                    st.rerun()
         else:
             st.info("👈 Enter text on the left to see AI improvements here")
 
+# Confirmation dialog for deletion; only rendered while open
+@st.dialog("Delete story?")
+def confirm_delete_story(story_id, title):
+    st.warning(f"⚠️ Are you sure you want to delete '{title}'? This cannot be undone!")
+    col_x, col_y = st.columns(2)
+    with col_x:
+        if st.button(f"Yes, delete", type="primary"):
+            delete_story(story_id)
+            if st.session_state.current_story_id == story_id:
+                set_current_story(None)
+            # Confirmed on the story list after the dialog closes
+            st.session_state.deleted_story_title = title
+            st.rerun()
+    with col_y:
+        if st.button(f"Cancel"):
+            st.rerun()
+
+def toggle_story(story_id):
+    """Expand or collapse a story in the story list"""
+    key = f'open_story_{story_id}'
+    st.session_state[key] = not st.session_state.get(key, False)
+
+def continue_story(story_id):
+    """Load a story and switch the sidebar to Story Writing before the click's rerun"""
+    set_current_story(story_id)
+    st.session_state.story_mode = 'continue'
+    st.session_state.mode = "📖 Story Writing"
+
 def story_list_mode():
     st.header("📊 Story List")
     
+    if 'deleted_story_title' in st.session_state:
+        st.success(f"Story '{st.session_state.deleted_story_title}' deleted successfully!")
+        del st.session_state.deleted_story_title
+    
     stories = get_stories()
     
     if not stories:
         st.info("📚 No stories yet! Create your first story in Story Writing mode.")
         return
     
+    # One grouped query covers every story's metrics
+    summaries = get_story_summaries()
+    
     # Create a table-like display
     for i, (story_id, title, created_at) in enumerate(stories, 1):
-        with st.expander(f"{i}. 📚 {title}"):
-            chapters = get_chapters(story_id)
-            
-            # Display metrics
-            col1, col2, col3, col4 = st.columns(4)
-            
-            with col1:
-                st.metric("📅 Created", created_at[:10])
-            
-            with col2:
-                # Count total chapters including the original opening
-                total_chapters = 1 + (len(chapters) * 2) if chapters else 1
-                st.metric("📖 Total Chapters", total_chapters)
+        # Collapsed stories render only their title button; the body below is
+        # skipped entirely instead of being built inside a closed expander
+        is_open = st.session_state.get(f'open_story_{story_id}', False)
+        st.button(f"{'▾' if is_open else '▸'} {i}. 📚 {title}", key=f"toggle_{story_id}",
+                  on_click=toggle_story, args=(story_id,), use_container_width=True)
+        if not is_open:
+            continue
+        
+        with st.container():
+            summary = summaries.get(story_id)
             
-            with col3:
-                if chapters:
-                    ai_ratings = [ch[5] for ch in chapters if ch[5]]
-                    if ai_ratings:
-                        avg_ai_rating = sum(ai_ratings) / len(ai_ratings)
-                        st.metric("🤖 Avg AI Rating", f"{avg_ai_rating:.1f}/5")
-                    else:
-                        st.metric("🤖 Avg AI Rating", "N/A")
+            # Display metrics, leaving out ratings that don't exist yet
+            # Count total chapters including the original opening
+            total_chapters = 1 + (summary['chapter_count'] * 2) if summary else 1
+            metrics = [("📅 Created", format_date(created_at)),
+                       ("📖 Total Chapters", total_chapters)]
+            if summary and summary['avg_ai_rating'] is not None:
+                metrics.append(("🤖 Avg AI Rating", f"{summary['avg_ai_rating']:.1f}/5"))
+            if summary and summary['avg_user_rating'] is not None:
+                metrics.append(("👤 Your Avg Rating", f"{summary['avg_user_rating']:.1f}/5"))
             
-            with col4:
-                user_ratings = [ch[4] for ch in chapters if ch[4]]
-                if user_ratings:
-                    avg_user_rating = sum(user_ratings) / len(user_ratings)
-                    st.metric("👤 Your Avg Rating", f"{avg_user_rating:.1f}/5")
-                else:
-                    st.metric("👤 Your Avg Rating", "N/A")
+            for col, (label, value) in zip(st.columns(len(metrics)), metrics):
+                col.metric(label, value)
+            if len(metrics) == 2:
+                st.caption("No ratings yet")
             
             # Show chapter summary
-            if chapters:
-                st.markdown("**Recent Activity:**")
+            if summary:
+                # Build the activity lines into one markdown call
+                activity = ["**Recent Activity:**"]
                 # Always show the first AI response (Chapter 2)
-                ai_level = chapters[0][6] if len(chapters[0]) > 6 else 'middle_school'
-                level_display = {"professional": "Prof", "college": "College", "middle_school": "MS"}.get(ai_level, "MS")
-                st.markdown(f"• Chapters 1-2 ({chapters[0][3]}, {level_display}) - "
-                          f"Your opening: {'⭐' * (chapters[0][5] or 0)}, "
-                          f"AI response: {'⭐' * (chapters[0][4] or 0) if chapters[0][4] else 'Not rated'}")
+                first = summary['first']
+                level_display = {"professional": "Prof", "college": "College", "middle_school": "MS"}.get(first["ai_level"], "MS")
+                activity.append(f"• Chapters 1-2 ({first['ai_style']}, {level_display}) - "
+                                f"Your opening: {STARS[first['ai_rating'] or 0]}, "
+                                f"AI response: {STARS[first['user_rating']] if first['user_rating'] else 'Not rated'}")
                 
                 # Show additional chapters if they exist
-                if len(chapters) > 1:
+                if summary['chapter_count'] > 1:
                     # Show the most recent chapter pair
-                    latest = chapters[-1]
-                    latest_user_ch = (len(chapters) - 1) * 2 + 1
+                    latest = summary['latest']
+                    latest_user_ch = (summary['chapter_count'] - 1) * 2 + 1
                     latest_ai_ch = latest_user_ch + 1
-                    ai_level = latest[6] if len(latest) > 6 else 'middle_school'
-                    level_display = {"professional": "Prof", "college": "College", "middle_school": "MS"}.get(ai_level, "MS")
-                    st.markdown(f"• Chapters {latest_user_ch}-{latest_ai_ch} ({latest[3]}, {level_display}) - "
-                              f"Your writing: {'⭐' * (latest[5] or 0)}, "
-                              f"AI writing: {'⭐' * (latest[4] or 0) if latest[4] else 'Not rated'}")
+                    level_display = {"professional": "Prof", "college": "College", "middle_school": "MS"}.get(latest["ai_level"], "MS")
+                    activity.append(f"• Chapters {latest_user_ch}-{latest_ai_ch} ({latest['ai_style']}, {level_display}) - "
+                                    f"Your writing: {STARS[latest['ai_rating'] or 0]}, "
+                                    f"AI writing: {STARS[latest['user_rating']] if latest['user_rating'] else 'Not rated'}")
+                st.markdown("\n\n".join(activity))
             
             # Action buttons
             col_a, col_b = st.columns([3, 1])
             with col_a:
-                if st.button(f"📖 Continue This Story", key=f"continue_{story_id}", use_container_width=True):
-                    st.session_state.current_story_id = story_id
-                    st.session_state.story_mode = 'continue'
-                    st.success("Story loaded! Switch to 📖 Story Writing mode to continue.")
-                    st.rerun()
+                st.button(f"📖 Continue This Story", key=f"continue_{story_id}", use_container_width=True,
+                          on_click=continue_story, args=(story_id,))
             
             with col_b:
                 if st.button(f"🗑️ Delete", key=f"delete_{story_id}", type="secondary", use_container_width=True):
-                    st.session_state[f'confirm_delete_{story_id}'] = True
-                    st.rerun()
-            
-            # Confirmation dialog for deletion
-            if st.session_state.get(f'confirm_delete_{story_id}', False):
-                st.warning(f"⚠️ Are you sure you want to delete '{title}'? This cannot be undone!")
-                col_x, col_y = st.columns(2)
-                with col_x:
-                    if st.button(f"Yes, delete", key=f"confirm_yes_{story_id}", type="primary"):
-                        delete_story(story_id)
-                        st.session_state[f'confirm_delete_{story_id}'] = False
-                        if st.session_state.current_story_id == story_id:
-                            st.session_state.current_story_id = None
-                        st.success(f"Story '{title}' deleted successfully!")
-                        st.rerun()
-                with col_y:
-                    if st.button(f"Cancel", key=f"confirm_no_{story_id}"):
-                        st.session_state[f'confirm_delete_{story_id}'] = False
-                        st.rerun()
+                    confirm_delete_story(story_id, title)
 
 if __name__ == "__main__":
     main()